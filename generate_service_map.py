@@ -24,113 +24,450 @@ Output format:
     "status": "FORWARDED|DROPPED"
   }
 ]
+
+With --format dot, the map is written as a Graphviz digraph instead, which can be
+rendered natively for large graphs, e.g.:
+
+    generate_service_map.py flows.json --format dot | sfdp -Tpng -o map.png
 """
 
 import json
+import os
 import sys
 import argparse
-from collections import defaultdict
+import contextlib
+import multiprocessing
+from functools import lru_cache
+
+try:
+    # orjson parses bytes directly and is several times faster than the stdlib
+    import orjson
+
+    def _loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity literals that json.loads accepts; let the
+            # stdlib decide, so invalid lines are reported exactly as before
+            return json.loads(data)
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def _dumps_line(obj):
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+
+    def _dumps_line(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+# pyarrow can read and aggregate NDJSON in native code (opt-in with --arrow). It
+# is imported on first use, since the import alone costs ~40 MB of memory.
+pa = pc = paj = None
 
+def load_arrow():
+    """Import pyarrow if needed; returns False if it is not installed."""
+    global pa, pc, paj
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.compute
+            import pyarrow.json
+        except ImportError:
+            return False
+        pa, pc, paj = pyarrow, pyarrow.compute, pyarrow.json
+    return True
+
+# Edge status is tracked as a bit set: each verdict sets one bit, and the
+# combined bits map to the reported status
+_VERDICT_BITS = {"FORWARDED": 1, "DROPPED": 2}
+_STATUS_MAP = {1: "FORWARDED", 2: "DROPPED", 3: "MIXED"}
+
+# Graphviz edge color for each status
+_DOT_COLORS = {"FORWARDED": "darkgreen", "DROPPED": "red", "MIXED": "orange"}
+
+class OutputError(Exception):
+    """Raised when writing results fails, as opposed to reading the input."""
+
+@lru_cache(maxsize=4096)
 def extract_service_name(pod_name):
     """Extract the service name from a pod name by removing the hash/replica suffix."""
     if not pod_name:
         return None
-    # Split on first hyphen followed by alphanumeric characters
-    parts = pod_name.split('-')
-    if len(parts) > 0:
-        return parts[0]
-    return None
-
-def process_flows(input_file):
-    # Use a dictionary to store unique edges with their status
-    edges = defaultdict(lambda: {"forwarded": False, "dropped": False})
-    
+    # Keep everything before the first hyphen
+    return pod_name.partition('-')[0]
+
+@lru_cache(maxsize=4096)
+def _cached_endpoint(name, namespace):
+    return sys.intern(f"{name} ({namespace})")
+
+def format_endpoint(name, namespace):
+    """Format a service endpoint label, interned so repeated edges share one string."""
     try:
-        with open(input_file, 'r') as f:
-            for line in f:
-                try:
-                    # Skip empty lines
-                    if not line.strip():
-                        continue
-                        
-                    flow = json.loads(line)
-                    
-                    # Extract source information if available
-                    src_pod = extract_service_name(flow.get("source_pod"))
-                    src_ns = flow.get("source_namespace")
-                    
-                    # Extract destination information
-                    dst_pod = extract_service_name(flow.get("destination_pod"))
-                    dst_ns = flow.get("destination_namespace")
-                    
-                    # Skip if we don't have enough information to create an edge
-                    if not dst_pod or not dst_ns:
-                        continue
-
-                    # For source, if we don't have pod/namespace info, mark as "external"
-                    source = f"{src_pod} ({src_ns})" if src_pod and src_ns else "external"
-                    destination = f"{dst_pod} ({dst_ns})"
-
-                    if source == destination:
-                        continue  # Skip self-referential flows
-
-                    protocol = flow.get("l4_protocol", "UNKNOWN")
-                    verdict = flow.get("verdict", "UNKNOWN")
-                    
-                    # Create a unique key for the edge
-                    edge_key = (source, destination, protocol)
-                    
-                    # Update edge information
-                    if verdict == "FORWARDED":
-                        edges[edge_key]["forwarded"] = True
-                    elif verdict == "DROPPED":
-                        edges[edge_key]["dropped"] = True
-
-                except json.JSONDecodeError as e:
-                    print(f"Warning: Invalid JSON on line: {e}", file=sys.stderr)
-                    continue
-                except Exception as e:
-                    print(f"Error processing flow: {e}", file=sys.stderr)
-                    continue
-
-        # Convert the edges to the output format
-        output_edges = []
-        for (src, dst, proto), status in edges.items():
-            edge = {
-                "source": src,
-                "destination": dst,
-                "protocol": proto,
-                "status": "MIXED" if status["forwarded"] and status["dropped"] else 
-                         "FORWARDED" if status["forwarded"] else 
-                         "DROPPED"
-            }
-            output_edges.append(edge)
-
-        return output_edges
+        return _cached_endpoint(name, namespace)
+    except TypeError:
+        # Unhashable values (e.g. a list-valued namespace) cannot be cached
+        return f"{name} ({namespace})"
+
+def iter_line_batches(f, chunk_size=65536, size=None):
+    """Yield newline-delimited records from a binary file object, one list per read.
+
+    Reads fixed-size chunks and splits each one into its complete lines with
+    bytes.split, avoiding the per-line overhead of text-mode iteration. If size
+    is given, at most that many bytes are read.
+    """
+    read = f.read
+    buf = b''
+    while size is None or size > 0:
+        chunk = read(chunk_size if size is None else min(chunk_size, size))
+        if not chunk:
+            break
+        if size is not None:
+            size -= len(chunk)
+        lines = (buf + chunk).split(b'\n')
+        # Keep the trailing partial line for the next chunk
+        buf = lines.pop()
+        if lines:
+            yield lines
+    if buf:
+        yield [buf]
+
+def edge_record(edge_key, status_bits):
+    """Convert an edge key and its status bits to the output format."""
+    src, dst, proto = edge_key
+    return {
+        "source": src,
+        "destination": dst,
+        "protocol": proto,
+        "status": _STATUS_MAP[status_bits],
+    }
+
+def dot_quote(value):
+    """Quote a string as a Graphviz ID."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def format_dot(edges):
+    """Render output-format edges as a Graphviz digraph, returned as bytes."""
+    lines = ["digraph depmap {", "  node [shape=box];"]
+    for edge in edges:
+        lines.append("  %s -> %s [label=%s, color=%s];" % (
+            dot_quote(edge["source"]),
+            dot_quote(edge["destination"]),
+            dot_quote(edge["protocol"]),
+            _DOT_COLORS[edge["status"]],
+        ))
+    lines.append("}")
+    return "\n".join(lines).encode()
+
+def arrow_column(table, name):
+    """Return a string column from table, or an all-null column if it is absent."""
+    if name not in table.column_names:
+        return pa.nulls(table.num_rows, pa.string())
+    column = table.column(name)
+    if pa.types.is_null(column.type):
+        return column.cast(pa.string())
+    return column
+
+def arrow_service_column(table, pod_field, ns_field):
+    """Build the "service (namespace)" labels for a pod/namespace column pair.
+
+    Returns the labels together with a mask of rows where both parts are present.
+    """
+    names = pc.list_element(pc.split_pattern(arrow_column(table, pod_field), '-', max_splits=1), 0)
+    namespaces = arrow_column(table, ns_field)
+    valid = pc.fill_null(pc.and_(pc.not_equal(names, ''), pc.not_equal(namespaces, '')), False)
+    return pc.binary_join_element_wise(names, ' (', namespaces, ')', ''), valid
+
+def aggregate_flows_arrow(input_file):
+    """Aggregate flow records into edges using pyarrow's streaming JSON reader.
+
+    Each record batch is aggregated with vectorized kernels and merged into the
+    edge dict, so memory grows with the number of unique edges rather than the
+    file size. Raises pa.ArrowException if the file cannot be read as records
+    with consistent field types (e.g. malformed lines). Returns None if some
+    records have a null l4_protocol, which the per-line parser must handle instead.
+    """
+    edges = {}
+    with paj.open_json(input_file) as reader:
+        for batch in reader:
+            table = pa.Table.from_batches([batch])
+
+            # Arrow reads both a missing key and an explicit null as null, but only a
+            # missing l4_protocol defaults to "UNKNOWN"; leave such files to the line parser
+            if "l4_protocol" in table.column_names and table.column("l4_protocol").null_count:
+                return None
+
+            source, src_valid = arrow_service_column(table, "source_pod", "source_namespace")
+            destination, dst_valid = arrow_service_column(table, "destination_pod", "destination_namespace")
+            # For source, if we don't have pod/namespace info, mark as "external"
+            source = pc.if_else(src_valid, source, "external")
+            protocol = pc.fill_null(arrow_column(table, "l4_protocol"), "UNKNOWN")
+            verdict = arrow_column(table, "verdict")
+
+            keep = pc.and_(dst_valid, pc.fill_null(pc.not_equal(source, destination), False))
+            keep = pc.and_(keep, pc.fill_null(pc.is_in(verdict, pa.array(list(_VERDICT_BITS))), False))
+
+            flows = pa.table({
+                "source": source,
+                "destination": destination,
+                "protocol": protocol,
+                "verdict": verdict,
+            }).filter(keep)
+            grouped = flows.group_by(["source", "destination", "protocol"]).aggregate([("verdict", "distinct")])
+
+            for src, dst, proto, verdicts in zip(*(grouped.column(name).to_pylist() for name in
+                                                   ("source", "destination", "protocol", "verdict_distinct"))):
+                status_bits = edges.get((src, dst, proto), 0)
+                for verdict in verdicts:
+                    status_bits |= _VERDICT_BITS[verdict]
+                edges[(src, dst, proto)] = status_bits
+    return edges
+
+def iter_flow_edges(lines):
+    """Yield an (edge_key, status_bit) pair for each usable JSON flow record in lines."""
+    # Bind hot-loop globals and methods to locals once, outside the loop
+    loads = _loads
+    service_name = extract_service_name
+    endpoint = format_endpoint
+    verdict_bit = _VERDICT_BITS.get
+
+    for line in lines:
+        try:
+            # Skip empty lines
+            if not line.strip():
+                continue
+
+            flow = loads(line)
+            get = flow.get
 
+            # Extract source information if available
+            src_pod = service_name(get("source_pod"))
+            src_ns = get("source_namespace")
+
+            # Extract destination information
+            dst_pod = service_name(get("destination_pod"))
+            dst_ns = get("destination_namespace")
+
+            # Skip if we don't have enough information to create an edge
+            if not dst_pod or not dst_ns:
+                continue
+
+            # For source, if we don't have pod/namespace info, mark as "external"
+            source = endpoint(src_pod, src_ns) if src_pod and src_ns else "external"
+            destination = endpoint(dst_pod, dst_ns)
+
+            if source == destination:
+                continue  # Skip self-referential flows
+
+            protocol = get("l4_protocol", "UNKNOWN")
+            verdict = get("verdict", "UNKNOWN")
+
+            # Create a unique key for the edge
+            edge_key = (source, destination, protocol)
+
+            bit = verdict_bit(verdict)
+            if bit is None:
+                continue
+
+            # Hash here so an unhashable field (e.g. a list-valued protocol) skips
+            # just this record instead of failing the batch deduplication
+            hash(edge_key)
+            yield edge_key, bit
+
+        except json.JSONDecodeError as e:
+            print(f"Warning: Invalid JSON on line: {e}", file=sys.stderr)
+            continue
+        except Exception as e:
+            print(f"Error processing flow: {e}", file=sys.stderr)
+            continue
+
+def aggregate_flows(batches, emit=None):
+    """Aggregate batches of JSON flow lines into a dict of unique edges.
+
+    If emit is given, it is called with (edge_key, status_bits) whenever an
+    edge is first seen or its status changes.
+    """
+    # Map each unique edge to its status bits
+    edges = {}
+    edge_status = edges.get
+
+    for batch in batches:
+        # Deduplicate the batch's (edge_key, status_bit) pairs in one C-level
+        # pass, keeping first-seen order, so the edge dict is only updated once
+        # per distinct pair rather than once per flow
+        for edge_key, bit in dict.fromkeys(iter_flow_edges(batch)):
+            # Update edge information
+            status_bits = edge_status(edge_key, 0)
+            if not status_bits & bit:
+                status_bits |= bit
+                edges[edge_key] = status_bits
+                if emit is not None:
+                    emit(edge_key, status_bits)
+
+    return edges
+
+def split_file(input_file, parts):
+    """Split a file into at most `parts` byte ranges aligned to line boundaries."""
+    size = os.path.getsize(input_file)
+    offsets = [0]
+    with open(input_file, 'rb') as f:
+        for i in range(1, parts):
+            offset = size * i // parts
+            if offset <= offsets[-1]:
+                continue
+            # Advance to the start of the first line beginning at or after offset
+            f.seek(offset - 1)
+            f.readline()
+            offset = f.tell()
+            if offsets[-1] < offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
+
+def aggregate_flow_range(task):
+    """Aggregate the flow records in one (input_file, start, end) byte range."""
+    input_file, start, end = task
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        return aggregate_flows(iter_line_batches(f, size=end - start))
+
+def aggregate_flows_parallel(input_file, jobs):
+    """Aggregate flow records with a pool of worker processes, one byte range each.
+
+    Only the per-range edge dicts are sent back to the parent, which merges
+    them by OR-ing the status bits.
+    """
+    tasks = [(input_file, start, end) for start, end in split_file(input_file, jobs)]
+    edges = {}
+    with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+        for partial in pool.imap_unordered(aggregate_flow_range, tasks):
+            for edge_key, status_bits in partial.items():
+                edges[edge_key] = edges.get(edge_key, 0) | status_bits
+    return edges
+
+def process_flows(input_file, emit=None, jobs=1, arrow=False):
+    try:
+        edges = None
+        if emit is None and jobs > 1:
+            edges = aggregate_flows_parallel(input_file, jobs)
+        # Streaming output needs per-flow updates, so it always uses the line parser
+        elif arrow and emit is None and load_arrow():
+            try:
+                edges = aggregate_flows_arrow(input_file)
+            except pa.ArrowException:
+                # Fall back to the per-line parser, which reports and skips bad records
+                edges = None
+
+        if edges is None:
+            with open(input_file, 'rb') as f:
+                edges = aggregate_flows(iter_line_batches(f), emit)
+
+        if emit is not None:
+            # Streamed edges have already been written; there is nothing to sort
+            return None
+
+        # Sort edges for consistent output on their (source, destination, protocol)
+        # key tuples, then convert them to the output format
+        return [edge_record(edge_key, status_bits) for edge_key, status_bits in sorted(edges.items())]
+
+    except OutputError:
+        raise
     except Exception as e:
         print(f"Error reading or processing file: {e}", file=sys.stderr)
         sys.exit(1)
 
+def output_failed(e):
+    """Report an error writing the results and exit.
+
+    A closed pipe (e.g. output piped to head) exits quietly.
+    """
+    if isinstance(e, BrokenPipeError):
+        # Point stdout at devnull so the interpreter's final flush cannot fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    else:
+        print(f"Error writing output: {e}", file=sys.stderr)
+    sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description='Generate service dependency map from flow records')
     parser.add_argument('input_file', help='JSON Lines file containing flow records (one per line)')
     parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+    parser.add_argument('--format', '-f', choices=['json', 'dot'], default='json',
+                        help='Output format: JSON edge list or Graphviz DOT (default: json)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write edges as JSON Lines as soon as they are seen or change status, '
+                             'instead of a sorted JSON array at the end; the last line for an edge '
+                             'holds its final status')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of worker processes used to parse the input (default: 1; '
+                             'ignored with --stream)')
+    parser.add_argument('--arrow', action='store_true',
+                        help='Aggregate with the pyarrow JSON reader; faster than the standard '
+                             'library parser when orjson is not installed, at the cost of a '
+                             'fixed ~150 MB of extra memory')
     
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.stream and args.format != 'json':
+        parser.error('--stream only supports --format json')
+    if args.arrow:
+        if not load_arrow():
+            parser.error('--arrow requires pyarrow')
+        if args.stream or args.jobs > 1:
+            parser.error('--arrow cannot be combined with --stream or --jobs')
     
-    edges = process_flows(args.input_file)
-    
-    # Sort edges for consistent output
-    edges.sort(key=lambda x: (x["source"], x["destination"], x["protocol"]))
+    if args.stream:
+        out = None
+
+        def open_output():
+            return open(args.output, 'wb') if args.output else sys.stdout.buffer
+
+        def emit(edge_key, status_bits):
+            # Open the output on the first edge, so an unreadable input does
+            # not truncate or create the output file
+            nonlocal out
+            try:
+                if out is None:
+                    out = open_output()
+                out.write(_dumps_line(edge_record(edge_key, status_bits)))
+            except OSError as e:
+                raise OutputError(e) from e
+
+        try:
+            process_flows(args.input_file, emit=emit)
+            if out is None:
+                out = open_output()
+            if args.output:
+                out.close()
+            else:
+                out.flush()
+        except (OutputError, OSError) as e:
+            if args.output and out is not None:
+                # Closing retries the failed flush; the first error is the one to report
+                with contextlib.suppress(OSError):
+                    out.close()
+            output_failed(e.__cause__ if isinstance(e, OutputError) else e)
+        return
+
+    edges = process_flows(args.input_file, jobs=args.jobs, arrow=args.arrow)
     
     # Output the results
-    output_json = json.dumps(edges, indent=2)
-    if args.output:
-        with open(args.output, 'w') as f:
-            f.write(output_json)
-    else:
-        print(output_json)
+    output_bytes = format_dot(edges) if args.format == 'dot' else _dumps(edges)
+    try:
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(output_bytes)
+        else:
+            sys.stdout.buffer.write(output_bytes + b'\n')
+            sys.stdout.buffer.flush()
+    except OSError as e:
+        output_failed(e)
 
 if __name__ == "__main__":
     main()
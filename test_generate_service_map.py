@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Tests for generate_service_map.py (run with: python3 -m unittest)."""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import generate_service_map as gsm
+
+FLOWS = [
+    {"source_pod": "frontend-77b645c847-wp9tx", "source_namespace": "boutique",
+     "destination_pod": "cartservice-5d844fc8b7-8xk2p", "destination_namespace": "boutique",
+     "l4_protocol": "TCP", "verdict": "FORWARDED"},
+    {"source_pod": "frontend-77b645c847-wp9tx", "source_namespace": "boutique",
+     "destination_pod": "cartservice-5d844fc8b7-8xk2p", "destination_namespace": "boutique",
+     "l4_protocol": "TCP", "verdict": "DROPPED"},
+    {"destination_pod": "frontend-77b645c847-wp9tx", "destination_namespace": "boutique",
+     "l4_protocol": "UDP", "verdict": "DROPPED"},
+    {"source_pod": "frontend-1", "source_namespace": "boutique",
+     "destination_pod": "frontend-2", "destination_namespace": "boutique",
+     "l4_protocol": "TCP", "verdict": "FORWARDED"},
+    {"source_pod": "frontend-1", "source_namespace": "boutique",
+     "destination_pod": "adservice-0", "destination_namespace": "boutique",
+     "l4_protocol": "TCP", "verdict": "AUDIT"},
+]
+
+NULL_PROTOCOL_FLOWS = [
+    {"source_pod": "frontend-1", "source_namespace": "boutique",
+     "destination_pod": "cartservice-1", "destination_namespace": "boutique",
+     "l4_protocol": None, "verdict": "FORWARDED"},
+    {"source_pod": "frontend-1", "source_namespace": "boutique",
+     "destination_pod": "cartservice-1", "destination_namespace": "boutique",
+     "verdict": "DROPPED"},
+]
+
+
+class FlowFileTestCase(unittest.TestCase):
+    def write_bytes(self, data):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def write_flows(self, flows):
+        return self.write_bytes(b''.join(json.dumps(flow).encode() + b'\n' for flow in flows))
+
+    def line_edges(self, path):
+        with open(path, 'rb') as f:
+            return gsm.aggregate_flows(gsm.iter_line_batches(f))
+
+
+class LineParserTest(FlowFileTestCase):
+    def test_unhashable_field_skips_record(self):
+        bad = dict(FLOWS[0], l4_protocol=["TCP"])
+        path = self.write_flows([bad, FLOWS[0]])
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            edges = self.line_edges(path)
+        self.assertEqual(edges, {("frontend (boutique)", "cartservice (boutique)", "TCP"): 1})
+        self.assertIn("unhashable", err.getvalue())
+
+    def test_unhashable_namespace_is_formatted(self):
+        path = self.write_flows([dict(FLOWS[0], destination_namespace=["boutique"])])
+        self.assertEqual(self.line_edges(path),
+                         {("frontend (boutique)", "cartservice (['boutique'])", "TCP"): 1})
+
+    def test_nan_literal_is_accepted(self):
+        line = json.dumps(dict(FLOWS[0], rtt=float('nan'))).encode()
+        self.assertIn(b'NaN', line)
+        path = self.write_bytes(line + b'\n')
+        self.assertEqual(self.line_edges(path),
+                         {("frontend (boutique)", "cartservice (boutique)", "TCP"): 1})
+
+
+class ParallelSplitTest(FlowFileTestCase):
+    def range_edges(self, path, parts):
+        """Merge per-range results the way aggregate_flows_parallel does, in-process."""
+        ranges = gsm.split_file(path, parts)
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Ranges must tile the file and each must start at the beginning of a line
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[start - 1:start], b'\n')
+        edges = {}
+        for start, end in ranges:
+            for edge_key, status_bits in gsm.aggregate_flow_range((path, start, end)).items():
+                edges[edge_key] = edges.get(edge_key, 0) | status_bits
+        return edges
+
+    def test_offset_on_newline(self):
+        first = json.dumps(FLOWS[0]).encode() + b' ' * 100 + b'\n'
+        second = json.dumps(FLOWS[1]).encode()
+        second += b' ' * (len(first) - 2 - len(second)) + b'\n'
+        data = first + second
+        # The midpoint falls on the newline ending the first line
+        self.assertEqual(data[len(data) // 2:len(data) // 2 + 1], b'\n')
+        path = self.write_bytes(data)
+        self.assertEqual(self.range_edges(path, 2), self.line_edges(path))
+        self.assertEqual(self.line_edges(path),
+                         {("frontend (boutique)", "cartservice (boutique)", "TCP"): 3})
+
+    def test_more_parts_than_lines(self):
+        path = self.write_flows(FLOWS[:3])
+        self.assertEqual(self.range_edges(path, 50), self.line_edges(path))
+
+    def test_empty_file(self):
+        path = self.write_bytes(b'')
+        self.assertEqual(gsm.split_file(path, 4), [(0, 0)])
+        self.assertEqual(self.range_edges(path, 4), {})
+        self.assertEqual(self.line_edges(path), {})
+
+    def test_last_line_without_newline(self):
+        # The unterminated last line is the FORWARDED flow that makes this edge MIXED
+        path = self.write_bytes(b'\n'.join(json.dumps(flow).encode() for flow in FLOWS[::-1]))
+        expected = self.line_edges(path)
+        self.assertEqual(expected[("frontend (boutique)", "cartservice (boutique)", "TCP")], 3)
+        for parts in range(1, 8):
+            self.assertEqual(self.range_edges(path, parts), expected)
+
+    def test_small_read_chunks(self):
+        path = self.write_flows(FLOWS)
+        with open(path, 'rb') as f:
+            lines = [line for batch in gsm.iter_line_batches(f, chunk_size=7, size=40) for line in batch]
+        with open(path, 'rb') as f:
+            self.assertEqual(b'\n'.join(lines), f.read(40))
+
+    def test_process_pool_matches_serial(self):
+        path = self.write_flows(FLOWS * 50)
+        self.assertEqual(gsm.aggregate_flows_parallel(path, 3), self.line_edges(path))
+
+    def test_rejects_jobs_below_one(self):
+        path = self.write_flows(FLOWS)
+        for jobs in ('0', '-2'):
+            with mock.patch('sys.argv', ['generate_service_map.py', path, '--jobs', jobs]), \
+                    contextlib.redirect_stderr(io.StringIO()) as err:
+                with self.assertRaises(SystemExit) as cm:
+                    gsm.main()
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn('--jobs must be at least 1', err.getvalue())
+
+
+class DotOutputTest(FlowFileTestCase):
+    def test_quote_escapes_backslash_and_quote(self):
+        self.assertEqual(gsm.dot_quote('a"b\\c'), '"a\\"b\\\\c"')
+        self.assertEqual(gsm.dot_quote(None), '"None"')
+
+    def test_status_colors(self):
+        edges = [
+            {"source": "a (x)", "destination": "b (x)", "protocol": "TCP", "status": "FORWARDED"},
+            {"source": "a (x)", "destination": "c (x)", "protocol": "UDP", "status": "DROPPED"},
+            {"source": 'say "hi" (x)', "destination": "c (x)", "protocol": "TCP", "status": "MIXED"},
+        ]
+        self.assertEqual(gsm.format_dot(edges).decode().splitlines(), [
+            'digraph depmap {',
+            '  node [shape=box];',
+            '  "a (x)" -> "b (x)" [label="TCP", color=darkgreen];',
+            '  "a (x)" -> "c (x)" [label="UDP", color=red];',
+            '  "say \\"hi\\" (x)" -> "c (x)" [label="TCP", color=orange];',
+            '}',
+        ])
+
+    def test_cli_dot_format(self):
+        path = self.write_flows(FLOWS)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_service_map.py')
+        result = subprocess.run([sys.executable, script, path, '--format', 'dot'],
+                                capture_output=True, check=True)
+        self.assertEqual(result.stdout.decode().splitlines(), [
+            'digraph depmap {',
+            '  node [shape=box];',
+            '  "external" -> "frontend (boutique)" [label="UDP", color=red];',
+            '  "frontend (boutique)" -> "cartservice (boutique)" [label="TCP", color=orange];',
+            '}',
+        ])
+
+
+class ArrowParityTest(FlowFileTestCase):
+
+    @unittest.skipIf(not gsm.load_arrow(), 'pyarrow is not installed')
+    def test_arrow_matches_line_parser(self):
+        path = self.write_flows(FLOWS)
+        self.assertEqual(gsm.aggregate_flows_arrow(path), self.line_edges(path))
+
+    @unittest.skipIf(not gsm.load_arrow(), 'pyarrow is not installed')
+    def test_arrow_defaults_missing_protocol(self):
+        flows = [{k: v for k, v in flow.items() if k != "l4_protocol"} for flow in FLOWS]
+        path = self.write_flows(flows)
+        edges = gsm.aggregate_flows_arrow(path)
+        self.assertEqual(edges, self.line_edges(path))
+        self.assertEqual({proto for _, _, proto in edges}, {"UNKNOWN"})
+
+    @unittest.skipIf(not gsm.load_arrow(), 'pyarrow is not installed')
+    def test_null_protocol_uses_line_parser(self):
+        path = self.write_flows(NULL_PROTOCOL_FLOWS)
+        self.assertIsNone(gsm.aggregate_flows_arrow(path))
+        self.assertEqual(self.line_edges(path), {
+            ("frontend (boutique)", "cartservice (boutique)", None): 1,
+            ("frontend (boutique)", "cartservice (boutique)", "UNKNOWN"): 2,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()